@@ -1,10 +1,23 @@
 from __future__ import print_function
+import os
+import atexit
 import sys
 import multiprocessing
-import dill
+import multiprocessing.util  # registers its atexit function before ours, so ours runs first
+import threading
+import pickle
+from random import shuffle
+from itertools import count, islice
 from tqdm.auto import tqdm
+from time import time
 from traceback import format_exc
-from pickle import PicklingError, dispatch_table
+from collections import OrderedDict
+from pickle import PicklingError, dispatch_table, HIGHEST_PROTOCOL
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
 
 PY3 = (sys.hexversion >= 0x3000000)
 
@@ -18,105 +31,185 @@ except ImportError:
 
 failed_rv = (lambda *args, **kwargs: None, ())
 cpu_count = int(multiprocessing.cpu_count())
+shm_threshold = 2 ** 20  # numpy arrays bigger than this (in bytes) are returned by the workers using shared memory
+mp_context = os.environ.get('PARFOR_MP_CONTEXT', 'spawn' if sys.platform == 'win32' else 'forkserver')
+_forkserver_preloaded = False
+_dill = None
+_Pickler = None
+
+
+def _define_pickler(dill):
+    """ Define Pickler only once dill is needed, importing dill takes time. """
+    class Pickler(dill.Pickler):
+        """ Overload dill to ignore unpickleble parts of objects.
+            You probably didn't want to use these parts anyhow.
+            However, if you did, you'll have to find some way to make them pickleble.
+        """
+        def save(self, obj, save_persistent_id=True):
+            """ Copied from pickle and amended. """
+            if PY3:
+                self.framer.commit_frame()
+
+            # Check for persistent id (defined by a subclass)
+            pid = self.persistent_id(obj)
+            if pid is not None and save_persistent_id:
+                self.save_pers(pid)
+                return
 
-
-class Pickler(dill.Pickler):
-    """ Overload dill to ignore unpickleble parts of objects.
-        You probably didn't want to use these parts anyhow.
-        However, if you did, you'll have to find some way to make them pickleble.
-    """
-    def save(self, obj, save_persistent_id=True):
-        """ Copied from pickle and amended. """
-        if PY3:
-            self.framer.commit_frame()
-
-        # Check for persistent id (defined by a subclass)
-        pid = self.persistent_id(obj)
-        if pid is not None and save_persistent_id:
-            self.save_pers(pid)
-            return
-
-        # Check the memo
-        x = self.memo.get(id(obj))
-        if x is not None:
-            self.write(self.get(x[0]))
-            return
-
-        rv = NotImplemented
-        reduce = getattr(self, "reducer_override", None)
-        if reduce is not None:
-            rv = reduce(obj)
-
-        if rv is NotImplemented:
-            # Check the type dispatch table
-            t = type(obj)
-            f = self.dispatch.get(t)
-            if f is not None:
-                f(self, obj)  # Call unbound method with explicit self
+            # Check the memo
+            x = self.memo.get(id(obj))
+            if x is not None:
+                self.write(self.get(x[0]))
                 return
 
-            # Check private dispatch table if any, or else
-            # copyreg.dispatch_table
-            reduce = getattr(self, 'dispatch_table', dispatch_table).get(t)
+            rv = NotImplemented
+            reduce = getattr(self, "reducer_override", None)
             if reduce is not None:
                 rv = reduce(obj)
-            else:
-                # Check for a class with a custom metaclass; treat as regular
-                # class
-                if issubclass(t, type):
-                    self.save_global(obj)
+
+            if rv is NotImplemented:
+                # Check the type dispatch table
+                t = type(obj)
+                f = self.dispatch.get(t)
+                if f is not None:
+                    f(self, obj)  # Call unbound method with explicit self
                     return
 
-                # Check for a __reduce_ex__ method, fall back to __reduce__
-                reduce = getattr(obj, "__reduce_ex__", None)
-                try:
-                    if reduce is not None:
-                        rv = reduce(self.proto)
-                    else:
-                        reduce = getattr(obj, "__reduce__", None)
+                # Check private dispatch table if any, or else
+                # copyreg.dispatch_table
+                reduce = getattr(self, 'dispatch_table', dispatch_table).get(t)
+                if reduce is not None:
+                    rv = reduce(obj)
+                else:
+                    # Check for a class with a custom metaclass; treat as regular
+                    # class
+                    if issubclass(t, type):
+                        self.save_global(obj)
+                        return
+
+                    # Check for a __reduce_ex__ method, fall back to __reduce__
+                    reduce = getattr(obj, "__reduce_ex__", None)
+                    try:
                         if reduce is not None:
-                            rv = reduce()
+                            rv = reduce(self.proto)
                         else:
-                            raise PicklingError("Can't pickle %r object: %r" %
-                                                (t.__name__, obj))
+                            reduce = getattr(obj, "__reduce__", None)
+                            if reduce is not None:
+                                rv = reduce()
+                            else:
+                                raise PicklingError("Can't pickle %r object: %r" %
+                                                    (t.__name__, obj))
+                    except Exception:
+                        rv = failed_rv
+
+            # Check for string returned by reduce(), meaning "save as global"
+            if isinstance(rv, str):
+                try:
+                    self.save_global(obj, rv)
                 except Exception:
-                    rv = failed_rv
+                    self.save_global(obj, failed_rv)
+                return
+
+            # Assert that reduce() returned a tuple
+            if not isinstance(rv, tuple):
+                raise PicklingError("%s must return string or tuple" % reduce)
+
+            # Assert that it returned an appropriately sized tuple
+            l = len(rv)
+            if not (2 <= l <= 6):
+                raise PicklingError("Tuple returned by %s must have "
+                                    "two to six elements" % reduce)
 
-        # Check for string returned by reduce(), meaning "save as global"
-        if isinstance(rv, str):
+            # Save the reduce() output and finally memoize the object
             try:
-                self.save_global(obj, rv)
+                self.save_reduce(obj=obj, *rv)
             except Exception:
-                self.save_global(obj, failed_rv)
-            return
+                self.save_reduce(obj=obj, *failed_rv)
 
-        # Assert that reduce() returned a tuple
-        if not isinstance(rv, tuple):
-            raise PicklingError("%s must return string or tuple" % reduce)
+    Pickler.__qualname__ = 'Pickler'
+    return Pickler
 
-        # Assert that it returned an appropriately sized tuple
-        l = len(rv)
-        if not (2 <= l <= 6):
-            raise PicklingError("Tuple returned by %s must have "
-                                "two to six elements" % reduce)
 
-        # Save the reduce() output and finally memoize the object
-        try:
-            self.save_reduce(obj=obj, *rv)
-        except Exception:
-            self.save_reduce(obj=obj, *failed_rv)
+def _import_dill():
+    """ Import dill on first use, most objects can be serialized with pickle. """
+    global _dill, _Pickler
+    if _dill is None:
+        import dill
+        _Pickler = _define_pickler(dill)
+        _dill = dill
+    return _dill
+
+
+def __getattr__(name):
+    if name == 'Pickler':
+        _import_dill()
+        return _Pickler
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
 
 def dumps(obj, protocol=None, byref=None, fmode=None, recurse=True, **kwds):
     """pickle an object to a string"""
-    protocol = dill.settings['protocol'] if protocol is None else int(protocol)
+    protocol = HIGHEST_PROTOCOL if protocol is None else int(protocol)
     _kwds = kwds.copy()
     _kwds.update(dict(byref=byref, fmode=fmode, recurse=recurse))
     file = StringIO()
-    Pickler(file, protocol, **_kwds).dump(obj)
+    _import_dill()
+    _Pickler(file, protocol, **_kwds).dump(obj)
     return file.getvalue()
 
 
+def _serialize(obj):
+    """ Serialize with pickle, which is faster than dill, and fall back to dill when pickle cannot do it.
+        Dill is also used when the pickle refers to __main__, which might not be available in the workers.
+        The first byte tells _deserialize which one was used. """
+    try:
+        ser = pickle.dumps(obj, HIGHEST_PROTOCOL)
+        if b'__main__' not in ser:
+            return b'P' + ser
+    except Exception:
+        pass
+    return b'D' + dumps(obj, recurse=True)
+
+
+def _deserialize(ser):
+    return (pickle.loads if ser[:1] == b'P' else _import_dill().loads)(ser[1:])
+
+
+def _dump_result(result):
+    """ Serialize a result in a worker. Big numpy arrays are copied into shared memory instead,
+        and only a reference ('shm', name, dtype, shape) is sent through the queue. """
+    np = sys.modules.get('numpy')
+    if shared_memory is not None and np is not None and type(result) is np.ndarray \
+            and result.nbytes > shm_threshold and not result.dtype.hasobject:
+        shm = shared_memory.SharedMemory(create=True, size=result.nbytes)
+        np.ndarray(result.shape, result.dtype, shm.buf)[...] = result
+        shm.close()
+        return 'shm', shm.name, result.dtype, result.shape  # the dtype itself, dtype.str drops field names
+    return _serialize(result)
+
+
+def _load_result(res):
+    """ Deserialize a result from a worker, copying arrays out of shared memory and releasing that memory. """
+    if not isinstance(res, tuple):
+        return _deserialize(res)
+    import numpy as np
+    shm = shared_memory.SharedMemory(res[1])
+    try:
+        return np.ndarray(res[3], res[2], shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _discard_results(results):
+    """ Release the shared memory of results nobody is going to load. """
+    for err, i, res in results:
+        if not err and isinstance(res, tuple):
+            shm = shared_memory.SharedMemory(res[1])
+            shm.close()
+            shm.unlink()
+
+
 class chunks():
     """ Yield successive chunks from lists.
         Usage: chunks(s, list0, list1, ...)
@@ -149,11 +242,11 @@ class chunks():
         self.A = len(args) == 1
         self.N = N
         self.len = max(1, min(N, n))
-        self.lengths = [((i + 1) * self.N // self.len) - (i * self.N // self.len) for i in range(self.len)]
+        self.edges = [i * self.N // self.len for i in range(self.len + 1)]
+        self.lengths = [q - p for p, q in zip(self.edges[:-1], self.edges[1:])]
 
     def __iter__(self):
-        for i in range(self.len):
-            p, q = (i * self.N // self.len), ((i + 1) * self.N // self.len)
+        for p, q in zip(self.edges[:-1], self.edges[1:]):
             yield self.args[0][p:q] if self.A else [a[p:q] for a in self.args]
 
     def __len__(self):
@@ -238,6 +331,7 @@ def parfor(*args, **kwargs):
             nP:     number of workers, default: None, overrides rP if not None
                 number of workers will always be at least 2
             serial: switch to serial if number of tasks less than serial, default: 4
+            chunksize: number of iterations sent to a worker together, default: None (1), or 'auto'
 
         output:       list with results from applying the decorated function to each iteration of the iterator
                       specified as the first argument to the function
@@ -305,43 +399,112 @@ def parfor(*args, **kwargs):
     return decfun
 
 
+def _identity(x):
+    return x
+
+
+_keys = count()  # unique keys for serialized objects, cheaper than hashing the serialization
+
+
+def _number_of_workers(rP=None, nP=None):
+    """ Number of workers from rP or nP, at least 2. """
+    if rP is None and nP is None:
+        nP = cpu_count
+    elif nP is None:
+        nP = int(round(rP * cpu_count))
+    return max(int(nP), 2)
+
+
+def _equal_immutables(a, b):
+    """ True if a and b are equal and made of immutable builtins only, so their serializations are equal too. """
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, tuple):
+        return len(a) == len(b) and all(_equal_immutables(i, j) for i, j in zip(a, b))
+    if isinstance(a, dict):  # dicts can be changed in place, so a and b need to be different dicts
+        return a is not b and list(a) == list(b) and all(_equal_immutables(a[k], b[k]) for k in a)
+    if isinstance(a, (float, complex)):  # 0.0 == -0.0, but the serializations differ
+        return repr(a) == repr(b)
+    return isinstance(a, (type(None), bool, int, str, bytes)) and a == b
+
+
+class _CacheMiss(Exception):
+    """ Only the key of an object was sent to a worker which does not have the object in its cache. """
+    pass
+
+
+def _get_from_simple_queue(Q, timeout):
+    """ Get an item from a SimpleQueue, raise Empty when no item is available within timeout.
+        SimpleQueue.get itself would block forever, even when another process took the item we were waiting for. """
+    if Q._rlock.acquire(timeout=timeout):
+        try:
+            if Q._reader.poll(timeout):
+                return Q._reader.recv()
+        finally:
+            Q._rlock.release()
+    raise multiprocessing.queues.Empty
+
+
 class parpool(object):
     """ Parallel processing with addition of iterations at any time and request of that result any time after that.
         The target function and its argument can be changed at any time.
     """
-    def __init__(self, fun=None, args=None, kwargs=None, rP=None, nP=None, bar=None, qbar=None, terminator=None):
+    def __init__(self, fun=None, args=None, kwargs=None, rP=None, nP=None, bar=None, qbar=None, terminator=None,
+                 prefetch=8):
         """ fun, args, kwargs: target function and its arguments and keyword arguments
             rP: ratio workers to cpu cores, default: 1
             nP: number of workers, default, None, overrides rP if not None
-            bar, qbar: instances of tqdm and tqdmm to use for monitoring buffer and progress """
-        if rP is None and nP is None:
-            self.nP = cpu_count
-        elif nP is None:
-            self.nP = int(round(rP * cpu_count))
-        else:
-            self.nP = int(nP)
-        self.nP = max(self.nP, 2)
-        self.fun = fun or (lambda x: x)
+            bar, qbar: instances of tqdm and tqdmm to use for monitoring buffer and progress
+            prefetch: number of tasks in flight per worker, default: 8
+                the queues can hold up to prefetch * nP pickled tasks and results in memory """
+        self.nP = _number_of_workers(rP, nP)
+        self.queuesize = max(8, prefetch * self.nP)
+        self._sent_keys = [set() for _ in range(self.nP)]  # keys of serialized objects sent to each queue
+        self._tasks = {}  # fully serialized tasks, to resend if a worker does not have everything in its cache
+        self._pending = []  # tasks waiting to be put in the queue as one batch
+        self.batchsize = 1
+        self.fun = fun or _identity
         self.args = args or ()
         self.kwargs = kwargs or {}
-        if hasattr(multiprocessing, 'get_context'):
-            ctx = multiprocessing.get_context('spawn')
-        else:
-            ctx = multiprocessing
+        ctx = self._get_context()
         self.A = ctx.Value('i', self.nP)
         self.E = ctx.Event()
-        self.Qi = ctx.Queue(3*self.nP)
-        self.Qo = ctx.Queue(3*self.nP)
-        self.P = ctx.Pool(self.nP, self._worker(self.Qi, self.Qo, self.A, self.E, terminator))
+        self.Qi = [ctx.SimpleQueue() for _ in range(self.nP)]  # one per worker, bounded by the tasks in flight
+        self.Qo = ctx.Queue()  # the feeder thread prevents blocking a worker while the main process puts in Qi
+        self.G = ctx.Value('i', 0)  # workers clear their caches when this changes
+        self.P = ctx.Pool(self.nP, self._worker(self.Qi, self.Qo, self.A, self.E, self.G, ctx.Value('i', 0),
+                                                terminator))
+        self._next_queue = 0
         self.is_alive = True
         self.res = {}
         self.handle = 0
-        self.handles = []
+        self.handles = set()
         self.bar = bar
         self.barlengths = {}
         self.qbar = qbar
-        if self.qbar is not None:
-            self.qbar.total = 3*self.nP
+
+    @property
+    def qbar(self):
+        return self._qbar
+
+    @qbar.setter
+    def qbar(self, qbar):
+        self._qbar = qbar
+        if qbar is not None:
+            qbar.total = self.queuesize
+
+    @staticmethod
+    def _get_context():
+        """ Context from the environment variable PARFOR_MP_CONTEXT, default: forkserver, or spawn on Windows.
+            The forkserver preloads the heavy modules once, so they do not need to be imported by every worker. """
+        global _forkserver_preloaded
+        if not hasattr(multiprocessing, 'get_context'):
+            return multiprocessing
+        ctx = multiprocessing.get_context(mp_context)
+        if mp_context == 'forkserver' and not _forkserver_preloaded:
+            ctx.set_forkserver_preload(['dill', 'tqdm', 'numpy'])
+            _forkserver_preloaded = True
+        return ctx
 
     @property
     def fun(self):
@@ -349,8 +512,9 @@ class parpool(object):
 
     @fun.setter
     def fun(self, fun):
-        funs = dumps(fun, recurse=True)
-        self._fun = (fun, hash(funs), funs)
+        funs = _serialize(fun)
+        self._fun = (fun, next(_keys), funs)
+        self._sent_keys = [set() for _ in range(self.nP)]
 
     @property
     def args(self):
@@ -358,8 +522,9 @@ class parpool(object):
 
     @args.setter
     def args(self, args):
-        argss = dumps(args, recurse=True)
-        self._args = (args, hash(argss), argss)
+        argss = _serialize(args)
+        self._args = (args, next(_keys), argss)
+        self._sent_keys = [set() for _ in range(self.nP)]
 
     @property
     def kwargs(self):
@@ -367,8 +532,15 @@ class parpool(object):
 
     @kwargs.setter
     def kwargs(self, kwargs):
-        kwargss = dumps(kwargs, recurse=True)
-        self._kwargs = (kwargs, hash(kwargss), kwargss)
+        kwargss = _serialize(kwargs)
+        self._kwargs = (kwargs, next(_keys), kwargss)
+        self._sent_keys = [set() for _ in range(self.nP)]
+
+    def _forget(self):
+        """ Drop fun, args and kwargs here and in the workers' caches, so an idle pool does not keep them alive. """
+        self.fun, self.args, self.kwargs = _identity, (), {}
+        with self.G.get_lock():
+            self.G.value += 1
 
     def __enter__(self, *args, **kwargs):
         return self
@@ -376,14 +548,72 @@ class parpool(object):
     def __exit__(self, *args, **kwargs):
         self.close()
 
-    def _getfromq(self):
-        """ Get an item from the queue and store it. """
+    def _put_task(self, handle, n):
+        """ Add a task to the pending batch, put the batch in a queue when it is full. """
+        self._tasks[handle] = task = (handle, n, self.fun, self.args, self.kwargs)
+        self._pending.append(task)
+        if len(self._pending) >= self.batchsize:
+            self._flush()
+
+    def _flush(self):
+        """ Put the pending tasks in the queue as one batch. """
+        if self._pending:
+            self._put_batch(self._pending)
+            self._pending = []
+
+    @staticmethod
+    def _group(tasks):
+        """ Group consecutive tasks using the same fun, args and kwargs, so these are sent only once per group:
+            [(Fun, Args, Kwargs, [(handle, n), ...]), ...] """
+        batch = []
+        for handle, n, Fun, Args, Kwargs in tasks:
+            if batch and [o[0] for o in batch[-1][:3]] == [Fun[0], Args[0], Kwargs[0]]:
+                batch[-1][3].append((handle, n))
+            else:
+                batch.append((Fun, Args, Kwargs, [(handle, n)]))
+        return batch
+
+    def _put_batch(self, tasks, q=None):
+        """ Put a batch of tasks in queue q, or in the queues of the workers in turn.
+            Objects already sent to that queue are sent by key only. """
+        if q is None:
+            q = self._next_queue
+            self._next_queue = (self._next_queue + 1) % self.nP
+        batch = []
+        for group in self._group(tasks):
+            objs = []
+            for h, ser in group[:3]:
+                if h in self._sent_keys[q]:
+                    objs.append((h, None))
+                else:
+                    self._sent_keys[q].add(h)
+                    objs.append((h, ser))
+            batch.append(tuple(objs) + group[3:])
+        self.Qi[q].put(batch)
+
+    @property
+    def _inflight(self):
+        """ Number of tasks, pending or sent to the workers, of which the result has not yet been received. """
+        return len(self._tasks)
+
+    def _getfromq(self, timeout=0.02):
+        """ Get a list of results from the queue and store them.
+            Returns as soon as results arrive, the timeout only limits how long to wait when they don't. """
         try:
-            err, i, res = self.Qo.get(True, 0.02)
+            results = self.Qo.get(True, timeout)
+        except multiprocessing.queues.Empty:
+            return
+        missed = {}
+        for err, i, res in results:
+            if err is None:  # worker number res did not have everything in its cache, send the task again
+                missed.setdefault(res, []).append(self._tasks[i])
+                continue
+            task = self._tasks.pop(i)
             if not err:
-                self.res[i] = dill.loads(res)
+                self.res[i] = _load_result(res)
             else:
-                n, fun, args, kwargs, e = [dill.loads(r) for r in res]
+                n, fun, args, kwargs = [_deserialize(task[1])] + [_deserialize(ser) for _, ser in task[2:]]
+                e = _deserialize(res)
                 print('Error from process working on iteration {}:\n'.format(i))
                 print(e)
                 self.close()
@@ -393,40 +623,45 @@ class parpool(object):
                                 .format(fun.__name__))
             if self.bar is not None:
                 self.bar.update(self.barlengths.pop(i))
-            self._qbar_update()
-        except multiprocessing.queues.Empty:
-            pass
+        for w, tasks in missed.items():  # the worker's own queue, now with everything it needs
+            self._sent_keys[w] = set()
+            self._put_batch(tasks, w)
+        self._qbar_update()
 
     def __call__(self, n, fun=None, args=None, kwargs=None, handle=None, barlength=1):
-        """ Add new iteration, using optional manually defined handle."""
+        """ Add new iteration, using optional manually defined handle.
+            Passing the same fun, or equal args and kwargs made of immutable builtins, does not serialize them again,
+            assign to fun, args or kwargs to force that. """
         if self.is_alive and not self.E.is_set():
-            n = dumps(n, recurse=True)
-            if fun is not None:
+            n = _serialize(n)
+            if fun is not None and fun is not self._fun[0]:
                 self.fun = fun
-            if args is not None:
+            if args is not None and not _equal_immutables(args, self._args[0]):
                 self.args = args
-            if kwargs is not None:
+            if kwargs is not None and not _equal_immutables(kwargs, self._kwargs[0]):
                 self.kwargs = kwargs
-            while self.Qi.full():
-                self._getfromq()
+            if self._inflight >= self.queuesize:
+                self._flush()  # the pending tasks might be the ones to wait for
+                while self._inflight >= self.queuesize:
+                    self._getfromq(1)
             if handle is None:
                 handle = self.handle
                 self.handle += 1
-                self.handles.append(handle)
-                self.Qi.put((handle, n, self.fun, self.args, self.kwargs))
+                self.handles.add(handle)
+                self._put_task(handle, n)
                 self.barlengths[handle] = barlength
                 self._qbar_update()
                 return handle
             elif handle not in self:
-                self.handles.append(handle)
-                self.Qi.put((handle, n, self.fun, self.args, self.kwargs))
+                self.handles.add(handle)
+                self._put_task(handle, n)
                 self.barlengths[handle] = barlength
             self._qbar_update()
 
     def _qbar_update(self):
         if self.qbar is not None:
             try:
-                self.qbar.n = self.Qi.qsize()
+                self.qbar.n = self._inflight
             except Exception:
                 pass
 
@@ -438,16 +673,18 @@ class parpool(object):
         """ Request result and delete its record. Wait if result not yet available. """
         if handle not in self:
             raise ValueError('No handle: {}'.format(handle))
+        self._flush()
         while handle not in self.res:
-            self._getfromq()
+            self._getfromq(1)
         self.handles.remove(handle)
         return self.res.pop(handle)
 
     def get_newest(self):
         """ Request the newest key and result and delete its record. Wait if result not yet available. """
         if len(self.handles):
+            self._flush()
             while not len(self.res):
-                self._getfromq()
+                self._getfromq(1)
             key = list(self.res.keys())[0]
             return key, self[key]
 
@@ -469,32 +706,45 @@ class parpool(object):
             self.E.set()
             self.P.close()
             while self.A.value:
-                self._empty_queue(self.Qi)
+                for Q in self.Qi:
+                    self._empty_simple_queue(Q)
                 self._empty_queue(self.Qo)
-            self._empty_queue(self.Qi)
+            for Q in self.Qi:
+                self._empty_simple_queue(Q)
             self._empty_queue(self.Qo)
             self.P.join()
-            self._close_queue(self.Qi)
+            for Q in self.Qi:
+                Q.close()
             self._close_queue(self.Qo)
             self.res = {}
             self.handle = 0
-            self.handles = []
+            self.handles = set()
+            self._tasks = {}
+            self._pending = []
 
     @staticmethod
     def _empty_queue(Q):
         if not Q._closed:
             while not Q.empty():
                 try:
-                    Q.get(True, 0.02)
+                    _discard_results(Q.get(True, 0.02))
                 except multiprocessing.queues.Empty:
                     pass
 
+    @staticmethod
+    def _empty_simple_queue(Q):
+        while True:
+            try:
+                _get_from_simple_queue(Q, 0.02)
+            except multiprocessing.queues.Empty:
+                break
+
     @staticmethod
     def _close_queue(Q):
         if not Q._closed:
             while not Q.empty():
                 try:
-                    Q.get(True, 0.02)
+                    _discard_results(Q.get(True, 0.02))
                 except multiprocessing.queues.Empty:
                     pass
             Q.close()
@@ -502,57 +752,177 @@ class parpool(object):
 
     class _worker(object):
         """ Manages executing the target function which will be executed in different processes. """
-        def __init__(self, Qi, Qo, A, E, terminator, cachesize=48):
-            self.cache = []
+        def __init__(self, Qi, Qo, A, E, G, W, terminator, cachesize=48):
+            self.cache = OrderedDict()
             self.Qi = Qi
             self.Qo = Qo
             self.A = A
             self.E = E
-            self.terminator = dumps(terminator, recurse=True)
+            self.G = G
+            self.generation = 0
+            self.W = W
+            self.terminator = _serialize(terminator)
             self.cachesize = cachesize
+            self.results = []
+            self.last_put = time()
 
         def add_to_q(self, value):
-            while not self.E.is_set():
-                try:
-                    self.Qo.put(value, timeout=0.1)
-                    break
-                except multiprocessing.queues.Full:
-                    continue
+            """ Collect results to put them in the queue together, at least every 0.1 s. """
+            self.results.append(value)
+            if time() - self.last_put > 0.1:
+                self.flush()
+
+        def flush(self):
+            if self.results:
+                while True:
+                    if self.E.is_set():  # nobody is going to load these results
+                        _discard_results(self.results)
+                        break
+                    try:
+                        self.Qo.put(self.results, timeout=0.1)
+                        break
+                    except multiprocessing.queues.Full:
+                        continue
+                self.results = []
+            self.last_put = time()
+
+        def get_batch(self, Q, others):
+            """ Get a batch from our own queue, or else steal one from the queue of another worker. """
+            try:
+                return _get_from_simple_queue(Q, 0.02)
+            except multiprocessing.queues.Empty:
+                shuffle(others)
+                for Q in others:
+                    try:
+                        return _get_from_simple_queue(Q, 0)
+                    except multiprocessing.queues.Empty:
+                        continue
+                raise
 
         def __call__(self):
+            with self.W.get_lock():  # workers replaced by the pool take over the queue of a previous worker
+                w = self.W.value % len(self.Qi)
+                self.W.value += 1
+            others = self.Qi[:w] + self.Qi[w + 1:]
             while not self.E.is_set():
-                i, n, Fun, Args, Kwargs = [None]*5
                 try:
-                    i, n, Fun, Args, Kwargs = self.Qi.get(True, 0.02)
-                    fun = self.get_from_cache(*Fun)
-                    args = self.get_from_cache(*Args)
-                    kwargs = self.get_from_cache(*Kwargs)
-                    self.add_to_q((False, i, dumps(fun(dill.loads(n), *args, **kwargs), recurse=True)))
+                    batch = self.get_batch(self.Qi[w], others)
                 except multiprocessing.queues.Empty:
+                    self.check_generation()
                     continue
-                except Exception:
-                    self.add_to_q((True, i, (n, Fun[1], Args[1], Kwargs[1], dumps(format_exc(), recurse=True))))
-                    self.E.set()
-            terminator = dill.loads(self.terminator)
+                self.check_generation()
+                for Fun, Args, Kwargs, tasks in batch:
+                    try:
+                        fun = self.get_from_cache(*Fun)
+                        args = self.get_from_cache(*Args)
+                        kwargs = self.get_from_cache(*Kwargs)
+                    except _CacheMiss:  # only the key was sent, but the object is not in the cache
+                        for i, _ in tasks:
+                            self.add_to_q((None, i, w))
+                        continue
+                    except Exception:
+                        self.add_to_q((True, tasks[0][0], _serialize(format_exc())))
+                        self.flush()
+                        self.E.set()
+                        break
+                    for i, n in tasks:
+                        if self.E.is_set():
+                            break
+                        try:
+                            self.add_to_q((False, i, _dump_result(fun(_deserialize(n), *args, **kwargs))))
+                        except Exception:
+                            self.add_to_q((True, i, _serialize(format_exc())))
+                            self.flush()
+                            self.E.set()
+                self.flush()
+                # don't keep these alive while waiting for the next batch
+                batch = Fun = Args = Kwargs = fun = args = kwargs = None
+            terminator = _deserialize(self.terminator)
             if terminator is not None:
                 terminator()
             with self.A.get_lock():
                 self.A.value -= 1
 
+        def check_generation(self):
+            """ Clear the cache when the main process asks for it. """
+            if self.G.value != self.generation:
+                self.generation = self.G.value
+                self.cache.clear()
+
         def get_from_cache(self, h, ser):
-            if len(self.cache):
-                hs, objs = zip(*self.cache)
-                if h in hs:
-                    return objs[hs.index(h)]
-            obj = dill.loads(ser)
-            self.cache.append((h, obj))
+            """ Get an object from the cache by its key, ser is None if the object is expected to be cached. """
+            if h in self.cache:
+                self.cache.move_to_end(h)
+                return self.cache[h]
+            if ser is None:
+                raise _CacheMiss(h)
+            obj = _deserialize(ser)
+            self.cache[h] = obj
             while len(self.cache) > self.cachesize:
-                self.cache.pop(0)
+                self.cache.popitem(last=False)
             return obj
 
 
+_pool_cache = {}  # an idle parpool by number of workers, a pool in use by pmap is taken out
+_pool_cache_lock = threading.Lock()
+
+
+def _get_pool(rP=None, nP=None):
+    """ Take a running parpool with the requested number of workers from the cache, or start a new one.
+        Concurrent callers each get their own pool. """
+    nP = _number_of_workers(rP, nP)
+    with _pool_cache_lock:
+        p = _pool_cache.pop(nP, None)
+    if p is not None and p.is_alive and not p.E.is_set():
+        return p
+    return parpool(nP=nP)
+
+
+def _release_pool(p):
+    """ Put a parpool back in the cache to be reused, close it if the cache already has an idle one. """
+    if p.is_alive and not p.E.is_set():
+        p._forget()
+        with _pool_cache_lock:
+            if p.nP not in _pool_cache:
+                _pool_cache[p.nP] = p
+                return
+    p.close()
+
+
+def shutdown_pool():
+    """ Close the parpools kept alive by pmap to be reused by subsequent calls. """
+    with _pool_cache_lock:
+        pools = list(_pool_cache.values())
+        _pool_cache.clear()
+    for p in pools:
+        p.close()
+
+
+atexit.register(shutdown_pool)
+
+
+class _chunk_fun(object):
+    """ Apply fun to each iteration in a chunk of iterations. """
+    def __init__(self, fun):
+        self.fun = fun
+        self.__name__ = getattr(fun, '__name__', repr(fun))
+
+    def __call__(self, chunk, *args, **kwargs):
+        return [self.fun(c, *args, **kwargs) for c in chunk]
+
+
+def _consecutive(iterable, size):
+    """ Yield lists of size consecutive items from iterable, without first making a list of all of them. """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 def pmap(fun, iterable=None, args=None, kwargs=None, length=None, desc=None, bar=True, qbar=False, terminator=None,
-         rP=1, nP=None, serial=4):
+         rP=1, nP=None, serial=4, chunksize=None):
     """ map a function fun to each iteration in iterable
             best use: iterable is a generator and length is given to this function
 
@@ -568,6 +938,8 @@ def pmap(fun, iterable=None, args=None, kwargs=None, length=None, desc=None, bar
         rP:     ratio workers to cpu cores, default: 1
         nP:     number of workers, default, None, overrides rP if not None
         serial: switch to serial if number of tasks less than serial, default: 4
+        chunksize: number of iterations sent to a worker together, default: None (1)
+            'auto': length // (4 * number of workers), useful when fun is fast compared to sending its arguments
     """
     args = args or ()
     kwargs = kwargs or {}
@@ -584,17 +956,51 @@ def pmap(fun, iterable=None, args=None, kwargs=None, length=None, desc=None, bar
         chunk = isinstance(iterable, chunks)
         if chunk:
             length = iterable.N
+        if chunksize == 'auto':
+            chunksize = max(1, length // (4 * _number_of_workers(rP, nP))) if length else 1
+        group = not chunk and chunksize is not None and chunksize > 1
+        if group:
+            fun, iterable = _chunk_fun(fun), _consecutive(iterable, chunksize)
         with external_bar(callback=qbar) if callable(qbar) \
                 else tqdmm(total=0, desc='Task buffer', disable=not qbar, leave=False) as qbar, \
              external_bar(callback=bar) if callable(bar) else tqdm(total=length, desc=desc, disable=not bar) as bar:
-            with parpool(fun, args, kwargs, rP, nP, bar, qbar, terminator) as p:
+            if terminator is None:  # reuse a pool from the cache, terminator can only run when the pool closes
+                p = _get_pool(rP, nP)
+            else:
+                p = parpool(fun, args, kwargs, rP, nP, bar, qbar, terminator)
+            try:
+                if terminator is None:
+                    p.fun, p.args, p.kwargs, p.bar, p.qbar = fun, args, kwargs, bar, qbar
+                if chunk:
+                    ntasks = len(iterable)
+                elif group:
+                    ntasks = -(-length // chunksize) if length else None
+                else:
+                    ntasks = length
+                if ntasks:  # batches of tasks, small enough to keep all workers busy
+                    p.batchsize = max(1, min(16, ntasks // (4 * p.nP)))
                 length = 0
+                n = 0
                 for i, j in enumerate(iterable):  # add work to the queue
                     if chunk:
                         p(j, handle=i, barlength=iterable.lengths[i])
+                    elif group:
+                        p(j, handle=i, barlength=len(j))
                     else:
                         p[i] = j
-                    if bar.total is None or bar.total < i+1:
-                        bar.total = i+1
+                    n += len(j) if group else 1
+                    if bar.total is None or bar.total < n:
+                        bar.total = n
                     length += 1
+                if group:
+                    return [r for i in range(length) for r in p[i]]
                 return [p[i] for i in range(length)]  # collect the results
+            except BaseException:  # the pool might still be busy with iterations nobody is waiting for
+                p.close()
+                raise
+            finally:
+                p.bar, p.qbar, p.batchsize = None, None, 1
+                if terminator is None:
+                    _release_pool(p)
+                else:
+                    p.close()